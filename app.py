@@ -1,22 +1,31 @@
 import os
 import re
+import html
+import codecs
+import socket
 import logging
+import threading
+import multiprocessing
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from urllib.parse import urljoin
+from typing import NamedTuple, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urljoin, urlsplit
 
+import orjson
 import requests
+from cachetools import TTLCache
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 
 # -------------------------------------------------------------------
 # Logging setup
 # -------------------------------------------------------------------
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),  # e.g. WARNING in production
     format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
 )
 logger = logging.getLogger("sc-court-scraper")
@@ -37,17 +46,67 @@ COUNTY_URLS = {
     "Williamsburg": "https://www.clerkoftrialcourt.com/Williamsburg/search_results.php",
 }
 
-MAX_WORKERS = int(os.getenv("MAX_WORKERS", len(COUNTY_URLS)))
+# Counties are served from a shared origin; one connection pool per host.
+COURT_HOSTS = {urlsplit(url).hostname for url in COUNTY_URLS.values()}
+
+# Scraper threads per scan; never more than one per county.
+MAX_WORKERS = min(int(os.getenv("MAX_WORKERS", len(COUNTY_URLS))), len(COUNTY_URLS))
+# Request threads per gunicorn worker (same env var and default as
+# gunicorn.conf.py); used to size the outbound connection pool.
+SERVER_THREADS = int(os.getenv("GUNICORN_THREADS", 8))
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", 30))
+MAX_RESPONSE_BYTES = int(os.getenv("MAX_RESPONSE_BYTES", 4 * 1024 * 1024))
+SCAN_CACHE_TTL = int(os.getenv("SCAN_CACHE_TTL", 120))  # seconds
+SCAN_CACHE_SIZE = int(os.getenv("SCAN_CACHE_SIZE", 512))
+DNS_CACHE_TTL = int(os.getenv("DNS_CACHE_TTL", 300))  # seconds
+# Processes used to parse result pages off the GIL; 0 parses in the
+# scraper thread itself.
+PARSE_PROCESSES = int(os.getenv("PARSE_PROCESSES", 0))
 
 HEADERS = {
     "User-Agent": (
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
         "AppleWebKit/537.36 (KHTML, like Gecko) "
         "Chrome/120.0.0.0 Safari/537.36"
-    )
+    ),
+    "Accept": "text/html,application/xhtml+xml",
+    # "br" is only decoded when the brotli package is installed
+    "Accept-Encoding": "gzip, deflate, br",
+    "Connection": "keep-alive",
 }
 
+# Result page markers, compiled once rather than on every scrape
+RESULTS_TABLE_SELECTOR = 'table[summary="Search Results"]'
+NO_RECORDS_RE = re.compile(
+    r"No records found matching your search criteria", re.IGNORECASE
+)
+
+# Declared page charset, from the Content-Type header or a <meta> tag
+CONTENT_TYPE_CHARSET_RE = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+META_CHARSET_RE = re.compile(rb"<meta[^>]+charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+
+# Optional regex fast path for the results table (see parse_rows_fast).
+# Off by default so a markup change on the clerk site can't silently
+# produce bad rows; the DOM parser is always used as the fallback.
+FAST_ROW_PARSER = os.getenv("FAST_ROW_PARSER", "0") == "1"
+
+RESULTS_TABLE_RE = re.compile(
+    rb'<table[^>]*summary="Search Results"[^>]*>(.*?)</table>',
+    re.IGNORECASE | re.DOTALL,
+)
+TABLE_ROW_RE = re.compile(rb"<tr[\s>]", re.IGNORECASE)
+TABLE_SECTION_RE = re.compile(rb"<(thead|tbody|tfoot)[\s>]", re.IGNORECASE)
+THEAD_CLOSE_RE = re.compile(rb"</thead\s*>", re.IGNORECASE)
+ROW_CELLS_RE = re.compile(
+    rb"<tr[^>]*>\s*"
+    rb'<td[^>]*>\s*(?:<a[^>]*href="([^"]*)"[^>]*>)?([^<]*)(?:</a>)?\s*</td>\s*'
+    rb"<td[^>]*>([^<]*)</td>\s*"
+    rb"<td[^>]*>([^<]*)</td>\s*"
+    rb"<td[^>]*>([^<]*)</td>\s*"
+    rb"<td[^>]*>([^<]*)</td>",
+    re.IGNORECASE,
+)
+
 # -------------------------------------------------------------------
 # Requests session with retries (more robust than raw requests.post)
 # -------------------------------------------------------------------
@@ -60,14 +119,335 @@ retry_config = Retry(
     allowed_methods=["HEAD", "GET", "OPTIONS", "POST"],
 )
 
-adapter = HTTPAdapter(max_retries=retry_config)
+# One shared session for every scan: keep-alive sockets to the clerk site
+# are reused across counties and across API calls. The pool holds one
+# socket per scraper thread a fully loaded worker can run
+# (SERVER_THREADS * MAX_WORKERS), so overlapping scans don't discard
+# connections when they finish.
+adapter = HTTPAdapter(
+    pool_connections=len(COURT_HOSTS),
+    pool_maxsize=SERVER_THREADS * MAX_WORKERS,
+    max_retries=retry_config,
+)
 session.mount("http://", adapter)
 session.mount("https://", adapter)
 
+# -------------------------------------------------------------------
+# DNS cache for the court hosts (getaddrinfo otherwise runs for every
+# new connection the pool opens)
+# -------------------------------------------------------------------
+dns_cache = TTLCache(maxsize=64, ttl=DNS_CACHE_TTL)
+dns_cache_lock = threading.Lock()
+system_getaddrinfo = socket.getaddrinfo
+
+
+def cached_getaddrinfo(host, port, *args, **kwargs):
+    if host not in COURT_HOSTS:
+        return system_getaddrinfo(host, port, *args, **kwargs)
+
+    key = (host, port, args, tuple(sorted(kwargs.items())))
+    with dns_cache_lock:
+        addrinfo = dns_cache.get(key)
+    if addrinfo is None:
+        # Lookup failures raise and are never cached
+        addrinfo = system_getaddrinfo(host, port, *args, **kwargs)
+        with dns_cache_lock:
+            dns_cache[key] = addrinfo
+    return addrinfo
+
+
+socket.getaddrinfo = cached_getaddrinfo
+
+
+# -------------------------------------------------------------------
+# Connection warm-up (run from gunicorn's post_worker_init hook)
+# -------------------------------------------------------------------
+def warm_connections():
+    """
+    Resolve each court host and open a keep-alive connection to it, so the
+    first scan after startup doesn't pay for DNS + TCP + TLS setup.
+    Called from gunicorn's post_worker_init hook.
+    """
+    origins = {
+        f"{parts.scheme}://{parts.netloc}/"
+        for parts in map(urlsplit, COUNTY_URLS.values())
+    }
+    for origin in origins:
+        try:
+            session.head(origin, headers=HEADERS, timeout=REQUEST_TIMEOUT)
+            logger.info("Warmed connection to %s", origin)
+        except requests.exceptions.RequestException as e:
+            logger.warning("Connection warm-up for %s failed: %s", origin, e)
+
+
+# -------------------------------------------------------------------
+# Scan response cache (court indexes change slowly; repeated dashboard
+# refreshes for the same name shouldn't re-scrape every county)
+# -------------------------------------------------------------------
+scan_cache = TTLCache(maxsize=SCAN_CACHE_SIZE, ttl=SCAN_CACHE_TTL)
+scan_cache_lock = threading.Lock()
+
 
 # -------------------------------------------------------------------
 # Scraper logic
 # -------------------------------------------------------------------
+class CaseRow(NamedTuple):
+    """
+    One case from a county's results table. Field names are the JSON keys;
+    rows are only turned into dicts when the response is serialized.
+    """
+
+    county: str
+    caseNumber: str
+    date: str
+    party: str
+    type: str
+    status: str
+    url: Optional[str]
+
+
+def read_body_capped(resp: requests.Response, max_bytes: int):
+    """
+    Read a streamed response body into bytes, stopping as soon as it grows
+    past max_bytes. Returns None if the cap was exceeded.
+    """
+    body = bytearray()
+    for chunk in resp.iter_content(chunk_size=64 * 1024):
+        body.extend(chunk)
+        if len(body) > max_bytes:
+            return None
+    return bytes(body)
+
+
+def page_encoding(content_type: str, html_bytes: bytes) -> Optional[str]:
+    """
+    Codec a county page must be decoded with, taken from the Content-Type
+    charset or else a <meta charset> near the top of the page.
+    Returns None for UTF-8 or when nothing usable is declared; the raw bytes
+    can then go straight to the parsers, which assume UTF-8.
+    """
+    match = CONTENT_TYPE_CHARSET_RE.search(content_type) or META_CHARSET_RE.search(
+        html_bytes[:2048]
+    )
+    if not match:
+        return None
+
+    charset = match.group(1)
+    if isinstance(charset, bytes):
+        charset = charset.decode("ascii")
+    try:
+        codec = codecs.lookup(charset).name
+    except LookupError:
+        return None
+
+    if codec == "utf-8":
+        return None
+    # Browsers read pages labelled Latin-1/ASCII as Windows-1252
+    if codec in ("iso8859-1", "ascii"):
+        return "cp1252"
+    return codec
+
+
+def parse_rows_fast(
+    html_bytes: bytes, county_name: str, base_url: str, encoding: Optional[str] = None
+):
+    """
+    Extract CaseRows straight from the raw response bytes with the
+    precompiled regexes above, without building a DOM. Cell text is
+    decoded with encoding (UTF-8 if None).
+    Returns None if the page doesn't match the expected 5-column layout
+    (no table, or any data row that fails to match) so the caller can
+    fall back to the full parser.
+    """
+    table_match = RESULTS_TABLE_RE.search(html_bytes)
+    if not table_match:
+        return None
+
+    table_html = table_match.group(1)
+    sections = [m.group(1).lower() for m in TABLE_SECTION_RE.finditer(table_html)]
+    if "tfoot" in sections or sections.count("tbody") > 1:
+        # The DOM path only reads the first <tbody>; leave these layouts to it
+        return None
+
+    row_starts = [m.start() for m in TABLE_ROW_RE.finditer(table_html)]
+
+    # Skip the header row the same way the DOM path does: rows after a
+    # <thead> are all data, otherwise the first row is the header.
+    if "thead" in sections:
+        thead_close = THEAD_CLOSE_RE.search(table_html)
+        if not thead_close:
+            return None
+        row_starts = [start for start in row_starts if start > thead_close.end()]
+    else:
+        row_starts = row_starts[1:]
+
+    results = []
+    for start in row_starts:
+        match = ROW_CELLS_RE.match(table_html, start)
+        if not match:
+            return None
+
+        raw_case_url, case_number, date, party, case_type, status = (
+            html.unescape(group.decode(encoding or "utf-8", "replace")).strip()
+            if group is not None
+            else None
+            for group in match.groups()
+        )
+        results.append(
+            CaseRow(
+                county_name,
+                case_number,
+                date,
+                party,
+                case_type,
+                status,
+                urljoin(base_url, raw_case_url) if raw_case_url else None,
+            )
+        )
+
+    return results
+
+
+def parse_results_table(
+    html_bytes: bytes, county_name: str, base_url: str, encoding: Optional[str] = None
+) -> list:
+    """
+    Parse a county search results page into a list of CaseRows.
+    Uses the regex fast path when FAST_ROW_PARSER is enabled and the page
+    fits it, otherwise the selectolax DOM parser. encoding is the page's
+    non-UTF-8 charset, if any (see page_encoding).
+    """
+    if FAST_ROW_PARSER:
+        fast_results = parse_rows_fast(html_bytes, county_name, base_url, encoding)
+        if fast_results is not None:
+            return fast_results
+        logger.debug("[%s] Fast row parser fell back to DOM parsing.", county_name)
+
+    results = []
+    # Lexbor reads bytes as UTF-8 and ignores the declared charset
+    tree = LexborHTMLParser(
+        html_bytes.decode(encoding, "replace") if encoding else html_bytes
+    )
+
+    # Find the main search results table
+    search_results_table = tree.css_first(RESULTS_TABLE_SELECTOR)
+    if not search_results_table:
+        # Explicit "no records" message
+        page_text = tree.body.text() if tree.body else ""
+        no_records_msg = NO_RECORDS_RE.search(page_text)
+        if no_records_msg:
+            logger.info("[%s] No records found.", county_name)
+            return results
+
+        logger.warning(
+            "[%s] No search results table or 'no records' message found. "
+            "Site structure may have changed.",
+            county_name,
+        )
+        return results
+
+    thead = search_results_table.css_first("thead")
+    tbody = search_results_table.css_first("tbody")
+    if tbody:
+        rows = tbody.css("tr")
+    elif thead:
+        rows = []  # header only
+    else:
+        rows = search_results_table.css("tr")
+
+    # Skip header row. With a <thead> the header lives there and every body
+    # row is data; otherwise the first body row is the header, whether it
+    # uses <th> or <td> cells. parse_rows_fast mirrors this.
+    if not thead:
+        rows = rows[1:]
+
+    for row in rows:
+        cols = row.css("td")
+        if len(cols) < 5:
+            continue
+
+        try:
+            case_link = cols[0].css_first("a")
+            case_number = (
+                case_link.text(strip=True) if case_link else cols[0].text(strip=True)
+            )
+
+            raw_case_url = case_link.attributes.get("href") if case_link else None
+            case_url = urljoin(base_url, raw_case_url) if raw_case_url else None
+
+            date = cols[1].text(strip=True)
+            party = cols[2].text(strip=True)
+            case_type = cols[3].text(strip=True)
+            status = cols[4].text(strip=True)
+
+            results.append(
+                CaseRow(
+                    county_name, case_number, date, party, case_type, status, case_url
+                )
+            )
+        except Exception as e:
+            logger.error("[%s] Error parsing row: %s", county_name, e)
+            continue
+
+    return results
+
+
+parse_pool = None
+parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Lazily create the shared parser process pool. Uses "spawn" since the
+    gunicorn workers that would fork it are multi-threaded.
+    """
+    global parse_pool
+    with parse_pool_lock:
+        if parse_pool is None:
+            parse_pool = ProcessPoolExecutor(
+                max_workers=PARSE_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return parse_pool
+
+
+def discard_parse_pool(broken_pool: ProcessPoolExecutor) -> None:
+    """
+    Drop a pool whose child process died (e.g. OOM-killed) so the next
+    get_parse_pool() call starts a fresh one. Only the given pool is
+    discarded, in case another thread has already replaced it.
+    """
+    global parse_pool
+    with parse_pool_lock:
+        if parse_pool is broken_pool:
+            parse_pool = None
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_in_pool(
+    html_bytes: bytes, county_name: str, base_url: str, encoding: Optional[str] = None
+) -> list:
+    """
+    Run parse_results_table in the parser process pool, replacing the
+    pool and retrying once if a child process has died.
+    """
+    for attempt in (1, 2):
+        pool = get_parse_pool()
+        try:
+            return pool.submit(
+                parse_results_table, html_bytes, county_name, base_url, encoding
+            ).result()
+        except BrokenProcessPool:
+            logger.warning(
+                "[%s] Parser process pool broke (attempt %d); recreating it.",
+                county_name,
+                attempt,
+            )
+            discard_parse_pool(pool)
+            if attempt == 2:
+                raise
+
+
 def scrape_county(county_name: str, url: str, search_name: str) -> dict:
     """
     Perform a POST search on a single county's court record website.
@@ -76,8 +456,7 @@ def scrape_county(county_name: str, url: str, search_name: str) -> dict:
       or
       { "county": <name>, "error": "<message>" }
     """
-    logger.info(f"[{county_name}] Starting scrape for search_name={search_name!r}")
-    results = []
+    logger.info("[%s] Starting scrape for search_name=%r", county_name, search_name)
 
     payload = {
         "search_type": "P",  # Search by party/person
@@ -86,90 +465,90 @@ def scrape_county(county_name: str, url: str, search_name: str) -> dict:
     }
 
     try:
-        resp = session.post(url, data=payload, headers=HEADERS, timeout=REQUEST_TIMEOUT)
-        resp.raise_for_status()
-
-        soup = BeautifulSoup(resp.content, "html.parser")
-
-        # Find the main search results table
-        search_results_table = soup.find("table", {"summary": "Search Results"})
-        if not search_results_table:
-            # Explicit "no records" message
-            no_records_msg = soup.find(
-                string=re.compile(
-                    r"No records found matching your search criteria", re.IGNORECASE
-                )
+        with session.post(
+            url, data=payload, headers=HEADERS, timeout=REQUEST_TIMEOUT, stream=True
+        ) as resp:
+            resp.raise_for_status()
+            logger.debug(
+                "[%s] Content-Encoding=%s",
+                county_name,
+                resp.headers.get("Content-Encoding", "identity"),
             )
-            if no_records_msg:
-                logger.info(f"[{county_name}] No records found.")
-                return {"county": county_name, "results": []}
 
+            # Bail out on headers alone before downloading anything we
+            # wouldn't parse (e.g. a PDF or error blob from a misconfigured origin)
+            content_type = resp.headers.get("Content-Type", "")
+            if content_type and "html" not in content_type.lower():
+                logger.warning(
+                    "[%s] Non-HTML response (%s); not parsing.",
+                    county_name,
+                    content_type,
+                )
+                return {
+                    "county": county_name,
+                    "error": f"Unexpected content type: {content_type}",
+                }
+
+            content_length = resp.headers.get("Content-Length", "")
+            if content_length.isdigit() and int(content_length) > MAX_RESPONSE_BYTES:
+                body = None
+            else:
+                body = read_body_capped(resp, MAX_RESPONSE_BYTES)
+
+        if body is None:
             logger.warning(
-                f"[{county_name}] No search results table or 'no records' message found. "
-                "Site structure may have changed."
+                "[%s] Response exceeded %d bytes; not parsing.",
+                county_name,
+                MAX_RESPONSE_BYTES,
             )
-            return {"county": county_name, "results": []}
+            return {
+                "county": county_name,
+                "error": f"Response too large (over {MAX_RESPONSE_BYTES} bytes)",
+            }
 
-        tbody = search_results_table.find("tbody")
-        rows = tbody.find_all("tr") if tbody else search_results_table.find_all("tr")
+        encoding = page_encoding(content_type, body)
 
-        # Skip header row if present
-        if len(rows) > 1:
-            rows = rows[1:]
+        if PARSE_PROCESSES > 0:
+            # Fetch stays on this thread; parsing runs in a separate process
+            results = parse_in_pool(body, county_name, url, encoding)
         else:
-            rows = []
+            results = parse_results_table(body, county_name, url, encoding)
 
-        for row in rows:
-            cols = row.find_all("td")
-            if len(cols) < 5:
-                continue
-
-            try:
-                case_link = cols[0].find("a")
-                case_number = (
-                    case_link.text.strip() if case_link else cols[0].get_text(strip=True)
-                )
-
-                raw_case_url = case_link.get("href") if case_link else None
-                case_url = urljoin(url, raw_case_url) if raw_case_url else None
-
-                date = cols[1].get_text(strip=True)
-                party = cols[2].get_text(strip=True)
-                case_type = cols[3].get_text(strip=True)
-                status = cols[4].get_text(strip=True)
-
-                results.append(
-                    {
-                        "county": county_name,
-                        "caseNumber": case_number,
-                        "date": date,
-                        "party": party,
-                        "type": case_type,
-                        "status": status,
-                        "url": case_url,
-                    }
-                )
-            except Exception as e:
-                logger.error(f"[{county_name}] Error parsing row: {e}")
-                continue
-
-        logger.info(f"[{county_name}] Scrape complete. {len(results)} record(s) found.")
+        logger.info("[%s] Scrape complete. %d record(s) found.", county_name, len(results))
         return {"county": county_name, "results": results}
 
     except requests.exceptions.HTTPError as e:
-        logger.error(f"[{county_name}] HTTP error: {e}")
+        logger.error("[%s] HTTP error: %s", county_name, e)
         return {"county": county_name, "error": f"HTTP error: {e}"}
     except requests.exceptions.RequestException as e:
-        logger.error(f"[{county_name}] Connection error: {e}")
+        logger.error("[%s] Connection error: %s", county_name, e)
         return {"county": county_name, "error": f"Connection error: {e}"}
     except Exception as e:
-        logger.exception(f"[{county_name}] Unexpected error during scraping: {e}")
+        logger.exception("[%s] Unexpected error during scraping: %s", county_name, e)
         return {"county": county_name, "error": f"Unexpected error: {e}"}
 
 
 # -------------------------------------------------------------------
 # Routes
 # -------------------------------------------------------------------
+def orjson_default(obj):
+    if isinstance(obj, CaseRow):
+        return obj._asdict()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def ojsonify(obj, status: int = 200):
+    """
+    jsonify() replacement backed by orjson, for the large scan payloads.
+    CaseRows are converted to JSON objects here, at encode time.
+    """
+    return app.response_class(
+        orjson.dumps(obj, default=orjson_default),
+        status=status,
+        mimetype="application/json",
+    )
+
+
 @app.route("/", methods=["GET"])
 def home():
     return jsonify(
@@ -186,6 +565,10 @@ def scan_courts():
     """
     Search all configured counties concurrently for a given name.
     Example: GET /api/scan?name=DOE,JOHN
+
+    Responses are cached per name for SCAN_CACHE_TTL seconds; pass
+    nocache=1 to force a fresh scrape. "queriedAt" reflects when the
+    counties were actually scraped.
     """
     search_name = request.args.get("name")
     if not search_name:
@@ -193,7 +576,17 @@ def scan_courts():
 
     # Simple normalization (trim extra spaces)
     normalized_name = " ".join(search_name.split())
-    logger.info(f"Scan requested for name={normalized_name!r}")
+    logger.info("Scan requested for name=%r", normalized_name)
+
+    cache_key = normalized_name.lower()
+    if request.args.get("nocache") != "1":
+        with scan_cache_lock:
+            cached = scan_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Serving cached scan for name=%r", normalized_name)
+            # The key is case-insensitive; echo this caller's query, not the
+            # one that populated the cache.
+            return ojsonify({**cached, "query": normalized_name})
 
     results_by_county = {}
     errors = {}
@@ -209,7 +602,7 @@ def scan_courts():
             try:
                 result = future.result()
             except Exception as e:
-                logger.exception(f"[{county}] Unhandled exception: {e}")
+                logger.exception("[%s] Unhandled exception: %s", county, e)
                 errors[county] = f"Unhandled exception: {e}"
                 continue
 
@@ -226,11 +619,15 @@ def scan_courts():
     }
     if errors:
         response["errors"] = errors
+    else:
+        # Only cache complete scans so a transient county failure is retried.
+        with scan_cache_lock:
+            scan_cache[cache_key] = response
 
-    return jsonify(response), 200
+    return ojsonify(response)
 
 
 if __name__ == "__main__":
-    # Local dev server; Render will use gunicorn instead.
+    # Local dev server only; production runs: gunicorn app:app -c gunicorn.conf.py
     port = int(os.getenv("PORT", 5000))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    app.run(host="0.0.0.0", port=port, debug=os.getenv("FLASK_DEBUG") == "1")
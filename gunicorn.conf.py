@@ -0,0 +1,27 @@
+# Production server config: gunicorn app:app -c gunicorn.conf.py
+#
+# /api/scan spends nearly all of its time waiting on the county sites, so
+# threaded workers let many scans overlap. Each scan fans out to at most
+# len(COUNTY_URLS) scraper threads (see MAX_WORKERS in app.py), so the
+# outbound thread count per process is roughly threads * MAX_WORKERS.
+# app.py sizes its connection pool to that same product (it reads the
+# same GUNICORN_THREADS variable), and it is also the number of requests
+# one worker can have in flight against the county clerk site, so the
+# default stays modest: 8 * 4 = 32 per worker.
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+keepalive = 15
+
+
+def post_worker_init(worker):
+    # Warm DNS + the keep-alive pool off the boot path
+    import threading
+
+    from app import warm_connections
+
+    threading.Thread(target=warm_connections, daemon=True).start()